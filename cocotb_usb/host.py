@@ -25,6 +25,10 @@ class UsbTest:
         decouple_clocks (bool, optional): Indicates whether host and device
             share clock signal. If set to False (default), you must provide
             clk48_device clock in test.
+        hdl_clocks (bool, optional): Indicates that the testbench generates
+            clk48_host and clk48_device itself. cocotb then only waits on
+            the clocks instead of driving them, which saves a simulator
+            callback per clock edge. Defaults to False.
     """
     # Retry interval if getting NAKs, arbitrary value - should be small enough
     # not to limit long transfers, but large enough not to pepper the traces
@@ -37,13 +41,16 @@ class UsbTest:
 
     def __init__(self, dut, **kwargs):
         decouple_clocks = kwargs.get('decouple_clocks', False)
+        hdl_clocks = kwargs.get('hdl_clocks', False)
         self.max_packet_size = kwargs.get('max_packet_size', 32)
         self.dut = dut
         self.clock_period = 20830
-        cocotb.fork(Clock(dut.clk48_host, self.clock_period, 'ps').start())
-        if not decouple_clocks:
+        if not hdl_clocks:
             cocotb.fork(
-                Clock(dut.clk48_device, self.clock_period, 'ps').start())
+                Clock(dut.clk48_host, self.clock_period, 'ps').start())
+            if not decouple_clocks:
+                cocotb.fork(
+                    Clock(dut.clk48_device, self.clock_period, 'ps').start())
 
         self.dut.usb_d_p = 0
         self.dut.usb_d_n = 0
@@ -117,7 +124,7 @@ class UsbTest:
         self.dut.usb_d_n = 0
 
         yield self.wait(time, "us")
-        self.connect()
+        yield self.connect()
         if recover:
             yield self.wait(1e4, "us")
 
@@ -1,13 +1,16 @@
+import logging
+import math
+
 import cocotb
-from cocotb.triggers import RisingEdge
-from cocotb.result import TestFailure, ReturnValue
+from cocotb.triggers import RisingEdge, First, Timer
+from cocotb.result import TestFailure
 from cocotb.utils import get_sim_time
 
 from cocotb_usb.usb.pid import PID
 from cocotb_usb.usb.endpoint import EndpointType, EndpointResponse
-from cocotb_usb.usb.packet import crc16
+from cocotb_usb.usb.packet import crc16, CRC16_TABLE, CRC16_RESIDUE
 
-from cocotb_usb.utils import grouper_tofit, parse_csr, assertEqual
+from cocotb_usb.utils import parse_csr, assertEqual
 
 from cocotb_usb.host import UsbTest
 
@@ -24,275 +27,387 @@ class UsbTestValenty(UsbTest):
         decouple_clocks (bool, optional): Indicates whether host and device
             share clock signal. If set to False, you must provide clk48_device
             clock in test.
+        hdl_clocks (bool, optional): Indicates that the testbench generates
+            the 48 MHz clocks itself.
+        check_crc (bool, optional): Verify the CRC16 of packets received by
+            the device. ValentyUSB already drops packets with a bad CRC, so
+            this is disabled by default.
+        wb_burst (bool, optional): Issue CSR write sequences as multiple
+            operations of a single Wishbone cycle. Not yet verified against
+            the Litex Wishbone2CSR bridge, so by default every write is a
+            cycle of its own.
+
+    The testbench may expose ``usb_setup_ready`` and ``usb_out_ready`` signals
+    that are high while the SETUP or OUT FIFO holds data. If present, the
+    harness waits on them instead of polling ``usb_setup_status`` and
+    ``usb_out_status``.
     """
+    # CSRs used by the harness, cached as ``_<name>`` attributes
+    CSR_NAMES = ('usb_in_ctrl', 'usb_in_data', 'usb_in_status',
+                 'usb_in_ev_pending', 'usb_in_ev_enable',
+                 'usb_out_ctrl', 'usb_out_data', 'usb_out_status',
+                 'usb_out_ev_pending', 'usb_out_ev_enable',
+                 'usb_setup_ctrl', 'usb_setup_data', 'usb_setup_status',
+                 'usb_setup_ev_pending', 'usb_setup_ev_enable',
+                 'usb_address', 'usb_pullup_out')
+
+    # Time to wait for a packet to show up in a FIFO (in microseconds).
+    # The wait starts as the host begins the transaction. The OUT token
+    # (32 bits + EOP) and a 64 byte DATA packet (544 bits, 634 with
+    # worst case bit stuffing, + EOP) take about 56 us at 12 Mbit/s. This is
+    # also about the time the original 128 CSR polls took.
+    FIFO_WAIT_TIME = 64
+
     def __init__(self, dut, csr_file, **kwargs):
         # Litex imports
         from cocotb_usb.wishbone import WishboneMaster
 
+        self.check_crc = kwargs.get('check_crc', False)
+        self.wb_burst = kwargs.get('wb_burst', False)
+        # Optional testbench signals, high while the FIFOs hold data
+        self.setup_ready = getattr(dut, 'usb_setup_ready', None)
+        self.out_ready = getattr(dut, 'usb_out_ready', None)
         self.wb = WishboneMaster(dut, "wishbone", dut.clk12, timeout=20)
         self.csrs = dict()
         self.csrs = parse_csr(csr_file)
+        # Resolve addresses once, they are used on every bus access
+        for name in self.CSR_NAMES:
+            setattr(self, '_' + name, self.csrs[name])
         super().__init__(dut, **kwargs)
 
-    @cocotb.coroutine
-    def reset(self):
-        yield super().reset()
-
-        # Enable endpoint 0
-        yield self.write(self.csrs['usb_setup_ev_enable'], 0xff)
-        yield self.write(self.csrs['usb_in_ev_enable'], 0xff)
-        yield self.write(self.csrs['usb_out_ev_enable'], 0xff)
+    async def reset(self):
+        await super().reset()
+
+        await self.write_many([
+            # Enable endpoint 0
+            (self._usb_setup_ev_enable, 0xff),
+            (self._usb_in_ev_enable, 0xff),
+            (self._usb_out_ev_enable, 0xff),
+
+            (self._usb_setup_ev_pending, 0xff),
+            (self._usb_in_ev_pending, 0xff),
+            (self._usb_out_ev_pending, 0xff),
+            (self._usb_address, 0),
+        ])
+
+    async def write(self, addr, val):
+        await self.wb.write(addr, val)
+
+    async def write_many(self, ops):
+        """Perform several CSR writes, in the given order.
+        With ``wb_burst`` set they share one Wishbone cycle, otherwise each
+        one is a separate :meth:`write`.
+
+        Args:
+            ops: Sequence of ``(addr, value)`` pairs.
+        """
+        if self.wb_burst:
+            await self.wb.write_many(ops)
+        else:
+            for addr, val in ops:
+                await self.write(addr, val)
 
-        yield self.write(self.csrs['usb_setup_ev_pending'], 0xff)
-        yield self.write(self.csrs['usb_in_ev_pending'], 0xff)
-        yield self.write(self.csrs['usb_out_ev_pending'], 0xff)
-        yield self.write(self.csrs['usb_address'], 0)
+    async def burst_write(self, addr, values):
+        """Write a sequence of values to a single CSR, e.g. to fill a FIFO.
+        See :meth:`write_many`.
 
-    @cocotb.coroutine
-    def write(self, addr, val):
-        yield self.wb.write(addr, val)
+        Args:
+            addr (int): Address of the CSR.
+            values: Values to be written, in order.
+        """
+        await self.write_many([(addr, v) for v in values])
 
-    @cocotb.coroutine
-    def read(self, addr):
-        value = yield self.wb.read(addr)
-        raise ReturnValue(value)
+    async def read(self, addr):
+        value = await self.wb.read(addr)
+        return value
 
-    @cocotb.coroutine
-    def connect(self):
-        USB_PULLUP_OUT = self.csrs['usb_pullup_out']
-        yield self.write(USB_PULLUP_OUT, 1)
+    async def connect(self):
+        await self.write(self._usb_pullup_out, 1)
 
-    @cocotb.coroutine
-    def clear_pending(self, epaddr):
+    async def clear_pending(self, epaddr):
         if EndpointType.epdir(epaddr) == EndpointType.IN:
             # Reset endpoint
             self.dut._log.info("Clearing IN_EV_PENDING")
-            yield self.write(self.csrs['usb_in_ctrl'], 0x20)
-            yield self.write(self.csrs['usb_in_ev_pending'], 0xff)
+            await self.write_many([(self._usb_in_ctrl, 0x20),
+                                   (self._usb_in_ev_pending, 0xff)])
         else:
             self.dut._log.info("Clearing OUT_EV_PENDING")
-            yield self.write(self.csrs['usb_out_ev_pending'], 0xff)
-            yield self.write(self.csrs['usb_out_ctrl'], 0x20)
+            await self.write_many([(self._usb_out_ev_pending, 0xff),
+                                   (self._usb_out_ctrl, 0x20)])
 
-    @cocotb.coroutine
-    def disconnect(self):
-        super().disconnect()
-        USB_PULLUP_OUT = self.csrs['usb_pullup_out']
+    async def disconnect(self):
+        await super().disconnect()
         self.address = 0
-        yield self.write(USB_PULLUP_OUT, 0)
+        await self.write(self._usb_pullup_out, 0)
 
-    @cocotb.coroutine
-    def pending(self, ep):
+    async def pending(self, ep):
         if EndpointType.epdir(ep) == EndpointType.IN:
-            val = yield self.read(self.csrs['usb_in_status'])
-            raise ReturnValue(val & (1 << 4))
+            val = await self.read(self._usb_in_status)
+            return val & (1 << 4)
         else:
-            val = yield self.read(self.csrs['usb_out_status'])
-            raise ReturnValue((val & (1 << 5) | (1 << 4))
-                              and (EndpointType.epnum(ep) == (val & 0x0f)))
-
-    @cocotb.coroutine
-    def expect_setup(self, epaddr, expected_data):
-        actual_data = []
-        # wait for data to appear
-        for i in range(128):
-            self.dut._log.debug("Prime loop {}".format(i))
-            status = yield self.read(self.csrs['usb_setup_status'])
-            have = status & 0x10
-            if have:
+            val = await self.read(self._usb_out_status)
+            # PEND (bit 5) or HAVE (bit 4) set for this endpoint
+            return (bool(val & ((1 << 5) | (1 << 4)))
+                    and EndpointType.epnum(ep) == (val & 0x0f))
+
+    async def _wait_status(self, addr, mask, deadline, signal=None):
+        """Wait until any of the bits in ``mask`` of a status CSR gets set.
+        If ``signal`` is given, wait for it to go high instead of polling the
+        CSR. Otherwise the CSR is read at least once, even if the deadline
+        has passed.
+
+        Args:
+            addr (int): Address of the status CSR.
+            mask (int): Bits to wait for.
+            deadline (float): Simulation time (in us) to give up at.
+            signal (optional): Testbench signal mirroring the status bits.
+
+        Returns:
+            Non-zero if the bits got set before the deadline.
+        """
+        if signal is not None:
+            if signal.value.binstr != '1':
+                timeout = deadline - get_sim_time("us")
+                if timeout > 0:
+                    # Whole microseconds can be represented at any
+                    # simulator precision
+                    await First(RisingEdge(signal),
+                                Timer(math.ceil(timeout), units='us'))
+            return mask if signal.value.binstr == '1' else 0
+
+        # No signal to wait on: poll the CSR once per clk12 edge, as before.
+        # Polling less often would delay the FIFO reads behind the bytes
+        # arriving from the wire, which has not been checked in simulation.
+        log = self.dut._log
+        debug = log.isEnabledFor(logging.DEBUG)
+        i = 0
+        while True:
+            if debug:
+                log.debug("Prime loop %d", i)
+            status = await self.read(addr)
+            if status & mask:
+                return status
+            if get_sim_time("us") >= deadline:
+                return 0
+            await RisingEdge(self.dut.clk12)
+            i += 1
+
+    async def _read_fifo(self, status_addr, data_addr, mask, limit,
+                         crc=False):
+        """Read bytes from a FIFO for as long as its status CSR reports data.
+
+        Args:
+            status_addr (int): Address of the status CSR.
+            data_addr (int): Address of the data CSR.
+            mask (int): Status bits indicating that the FIFO has data.
+            limit (int): Maximum number of bytes to read.
+            crc (bool, optional): Run the CRC16 over the bytes as they are
+                read.
+
+        Returns:
+            Tuple of the bytes read, as :class:`bytes`, and the CRC16
+            register after them (``None`` unless ``crc`` is set). The register
+            equals ``CRC16_RESIDUE`` if the data ended with a valid CRC16.
+        """
+        log = self.dut._log
+        debug = log.isEnabledFor(logging.DEBUG)
+        table = CRC16_TABLE
+        reg = 0xffff if crc else None
+        buf = bytearray(limit)
+        n = 0
+        while n < limit:
+            if debug:
+                log.debug("Read loop %d", n)
+            status = await self.read(status_addr)
+            if not status & mask:
                 break
-            yield RisingEdge(self.dut.clk12)
-
-        for i in range(48):
-            self.dut._log.debug("Read loop {}".format(i))
-            status = yield self.read(self.csrs['usb_setup_status'])
-            have = status & 0x10
-            if not have:
-                break
-            v = yield self.read(self.csrs['usb_setup_data'])
-            actual_data.append(v)
-            yield RisingEdge(self.dut.clk12)
+            v = await self.read(data_addr)
+            buf[n] = v & 0xff
+            if crc:
+                reg = table[(reg ^ v) & 0xff] ^ (reg >> 8)
+            n += 1
+            # Do not outrun the bytes still arriving from the wire
+            await RisingEdge(self.dut.clk12)
+        return bytes(buf[:n]), reg
+
+    async def expect_setup(self, epaddr, expected_data):
+        # wait for data to appear
+        deadline = get_sim_time("us") + self.FIFO_WAIT_TIME
+        await self._wait_status(self._usb_setup_status, 0x10, deadline,
+                                self.setup_ready)
+        actual_data, reg = await self._read_fifo(self._usb_setup_status,
+                                                 self._usb_setup_data,
+                                                 0x10, 48, self.check_crc)
 
         if len(actual_data) < 2:
             raise TestFailure("data was short (got {}, expected {})".format(
-                expected_data, actual_data))
-        actual_data, actual_crc16 = actual_data[:-2], actual_data[-2:]
+                expected_data, list(actual_data)))
+        actual_data, actual_crc16 = list(actual_data[:-2]), actual_data[-2:]
 
         self.print_ep(epaddr, "Got: %r (expected: %r)", actual_data,
                       expected_data)
         assertEqual(expected_data, actual_data,
                     "SETUP packet not received")
-        assertEqual(crc16(expected_data), actual_crc16,
-                    "CRC16 not valid")
+        # CRC16 was run while reading, only build a message on mismatch
+        if self.check_crc and reg != CRC16_RESIDUE:
+            assertEqual(crc16(expected_data), list(actual_crc16),
+                        "CRC16 not valid")
         # Acknowledge that we've handled the setup packet
-        yield self.write(self.csrs['usb_setup_ctrl'], 2)
-
-    @cocotb.coroutine
-    def drain_setup(self):
-        actual_data = []
-        for i in range(48):
-            status = yield self.read(self.csrs['usb_setup_status'])
-            have = status & 0x10
-            if not have:
-                break
-            v = yield self.read(self.csrs['usb_setup_data'])
-            actual_data.append(v)
-            yield RisingEdge(self.dut.clk12)
-        yield self.write(self.csrs['usb_setup_ctrl'], 2)
-        # Drain the pending bit
-        yield self.write(self.csrs['usb_setup_ev_pending'], 0xff)
-        return actual_data
-
-    @cocotb.coroutine
-    def drain_out(self):
-        actual_data = []
-        for i in range(70):
-            status = yield self.read(self.csrs['usb_out_status'])
-            have = status & (1 << 4)
-            if not have:
-                break
-            v = yield self.read(self.csrs['usb_out_data'])
-            actual_data.append(v)
-            yield RisingEdge(self.dut.clk12)
-        yield self.write(self.csrs['usb_out_ev_pending'], 0xff)
-        yield self.write(self.csrs['usb_out_ctrl'], 0x10)
-        return actual_data[:-2]  # Strip off CRC16
-
-    @cocotb.coroutine
-    def expect_data(self, epaddr, expected_data, expected):
-        actual_data = []
-        # wait for data to appear
-        for i in range(128):
-            self.dut._log.debug("Prime loop {}".format(i))
-            status = yield self.read(self.csrs['usb_out_status'])
-            have = status & (1 << 4)
-            if have:
-                break
-            yield RisingEdge(self.dut.clk12)
-
-        for i in range(256):
-            self.dut._log.debug("Read loop {}".format(i))
-            status = yield self.read(self.csrs['usb_out_status'])
-            have = status & (1 << 4)
-            if not have:
-                break
-            v = yield self.read(self.csrs['usb_out_data'])
-            actual_data.append(v)
-            yield RisingEdge(self.dut.clk12)
+        await self.write(self._usb_setup_ctrl, 2)
+
+    async def drain_setup(self):
+        actual_data, _ = await self._read_fifo(self._usb_setup_status,
+                                               self._usb_setup_data,
+                                               0x10, 48)
+        await self.write_many([
+            (self._usb_setup_ctrl, 2),
+            # Drain the pending bit
+            (self._usb_setup_ev_pending, 0xff),
+        ])
+        return list(actual_data)
+
+    async def drain_out(self):
+        actual_data, _ = await self._read_fifo(self._usb_out_status,
+                                               self._usb_out_data,
+                                               1 << 4, 70)
+        await self.write_many([(self._usb_out_ev_pending, 0xff),
+                               (self._usb_out_ctrl, 0x10)])
+        return list(actual_data[:-2])  # Strip off CRC16
+
+    async def expect_data(self, epaddr, expected_data, expected,
+                          deadline=None):
+        # wait for data to appear, no later than the deadline of the
+        # transfer if the caller knows it
+        wait_until = get_sim_time("us") + self.FIFO_WAIT_TIME
+        if deadline is not None:
+            wait_until = min(deadline, wait_until)
+        await self._wait_status(self._usb_out_status, 1 << 4, wait_until,
+                                self.out_ready)
+        actual_data, reg = await self._read_fifo(self._usb_out_status,
+                                                 self._usb_out_data,
+                                                 1 << 4, 256,
+                                                 self.check_crc)
 
         if expected == PID.ACK:
             if len(actual_data) < 2:
-                raise TestFailure("data {} was short".format(actual_data))
-            actual_data, actual_crc16 = actual_data[:-2], actual_data[-2:]
+                raise TestFailure("data {} was short".format(
+                    list(actual_data)))
+            actual_data, actual_crc16 = (list(actual_data[:-2]),
+                                         actual_data[-2:])
 
             self.print_ep(epaddr, "Got: %r (expected: %r)", actual_data,
                           expected_data)
             assertEqual(expected_data, actual_data,
                         "DATA packet not correctly received")
-            assertEqual(crc16(expected_data), actual_crc16,
-                        "CRC16 not valid")
-            pending = yield self.read(self.csrs['usb_out_ev_pending'])
+            # CRC16 was run while reading, only build a message on mismatch
+            if self.check_crc and reg != CRC16_RESIDUE:
+                assertEqual(crc16(expected_data), list(actual_crc16),
+                            "CRC16 not valid")
+            pending = await self.read(self._usb_out_ev_pending)
             if pending != 1:
                 raise TestFailure('event not generated')
-            yield self.write(self.csrs['usb_out_ev_pending'], pending)
-
-    @cocotb.coroutine
-    def set_response(self, ep, response):
-        if (EndpointType.epdir(ep) == EndpointType.IN
-                and response == EndpointResponse.ACK):
-            yield self.write(self.csrs['usb_in_ctrl'], EndpointType.epnum(ep))
-        elif (EndpointType.epdir(ep) == EndpointType.OUT
-                and response == EndpointResponse.ACK):
-            yield self.write(self.csrs['usb_out_ctrl'],
-                             0x10 | EndpointType.epnum(ep))
-
-    @cocotb.coroutine
-    def send_data(self, token, ep, data):
-        for b in data:
-            yield self.write(self.csrs['usb_in_data'], b)
-        yield self.write(self.csrs['usb_in_ctrl'],
-                         EndpointType.epnum(ep) & 0x0f)
-
-    @cocotb.coroutine
-    def transaction_setup(self, addr, data, epnum=0):
+            await self.write(self._usb_out_ev_pending, pending)
+
+    async def set_response(self, ep, response):
+        if response != EndpointResponse.ACK:
+            return
+        epnum = EndpointType.epnum(ep)
+        if EndpointType.epdir(ep) == EndpointType.IN:
+            await self.write(self._usb_in_ctrl, epnum)
+        else:
+            await self.write(self._usb_out_ctrl, 0x10 | epnum)
+
+    async def send_data(self, token, ep, data):
+        ops = [(self._usb_in_data, b) for b in data]
+        ops.append((self._usb_in_ctrl, EndpointType.epnum(ep) & 0x0f))
+        await self.write_many(ops)
+
+    async def transaction_setup(self, addr, data, epnum=0):
         epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
 
         xmit = cocotb.fork(self.host_setup(addr, epnum, data))
-        yield self.expect_setup(epaddr_out, data)
-        yield xmit.join()
-
-    @cocotb.coroutine
-    def transaction_data_out(self,
-                             addr,
-                             ep,
-                             data,
-                             chunk_size=64,
-                             expected=PID.ACK,
-                             datax=PID.DATA1):
+        await self.expect_setup(epaddr_out, data)
+        await xmit.join()
+
+    async def transaction_data_out(self,
+                                   addr,
+                                   ep,
+                                   data,
+                                   chunk_size=64,
+                                   expected=PID.ACK,
+                                   datax=PID.DATA1):
         epnum = EndpointType.epnum(ep)
+        max_packet_time = self.MAX_PACKET_TIME
 
         # # Set it up so we ACK the final IN packet
-        # yield self.write(self.csrs['usb_in_ctrl'], 0)
-        for _i, chunk in enumerate(grouper_tofit(chunk_size, data)):
+        # await self.write(self._usb_in_ctrl, 0)
+        mv = memoryview(bytes(data))
+        for i in range(0, len(mv), chunk_size):
+            chunk = list(mv[i:i + chunk_size])
             self.dut._log.warning("Sending {} bytes to host"
                                   .format(len(chunk)))
-            self.packet_deadline = get_sim_time("us") + super().MAX_PACKET_TIME
+            self.packet_deadline = get_sim_time("us") + max_packet_time
             # Enable receiving data
-            yield self.set_response(ep, EndpointResponse.ACK)
+            await self.set_response(ep, EndpointResponse.ACK)
             xmit = cocotb.fork(
                 self.host_send(datax, addr, epnum, chunk, expected))
-            yield self.expect_data(epnum, list(chunk), expected)
-            yield xmit.join()
+            await self.expect_data(epnum, chunk, expected,
+                                   self.packet_deadline)
+            await xmit.join()
 
             if datax == PID.DATA0:
                 datax = PID.DATA1
             else:
                 datax = PID.DATA0
 
-    @cocotb.coroutine
-    def transaction_data_in(self,
-                            addr,
-                            ep,
-                            data,
-                            chunk_size=64,
-                            datax=PID.DATA1):
+    async def transaction_data_in(self,
+                                  addr,
+                                  ep,
+                                  data,
+                                  chunk_size=64,
+                                  datax=PID.DATA1):
         epnum = EndpointType.epnum(ep)
+        in_data, in_ctrl = self._usb_in_data, self._usb_in_ctrl
+        log = self.dut._log
+        debug = log.isEnabledFor(logging.DEBUG)
         sent_data = 0
-        for i, chunk in enumerate(grouper_tofit(chunk_size, data)):
+        mv = memoryview(bytes(data))
+        for i in range(0, len(mv), chunk_size):
+            chunk = mv[i:i + chunk_size]
             # Do we still have time?
             current = get_sim_time("us")
             if current > self.request_deadline:
                 raise TestFailure("Failed to get all data in time")
 
-            self.dut._log.debug("Expecting chunk {}".format(i))
+            if debug:
+                log.debug("Expecting chunk %d", i // chunk_size)
             self.packet_deadline = current + 5e2  # 500 ms
 
             sent_data = 1
-            self.dut._log.debug(
-                "Actual data we're expecting: {}".format(chunk))
-            for b in chunk:
-                yield self.write(self.csrs['usb_in_data'], b)
-            yield self.write(self.csrs['usb_in_ctrl'], epnum)
-            recv = cocotb.fork(self.host_recv(datax, addr, epnum, chunk))
-            yield recv.join()
+            if debug:
+                log.debug("Actual data we're expecting: %s", list(chunk))
+            ops = [(in_data, b) for b in chunk]
+            ops.append((in_ctrl, epnum))
+            await self.write_many(ops)
+            recv = cocotb.fork(self.host_recv(datax, addr, epnum,
+                                              list(chunk)))
+            await recv.join()
 
             if datax == PID.DATA0:
                 datax = PID.DATA1
             else:
                 datax = PID.DATA0
         if not sent_data:
-            yield self.write(self.csrs['usb_in_ctrl'], epnum)
+            await self.write(in_ctrl, epnum)
             recv = cocotb.fork(self.host_recv(datax, addr, epnum, []))
-            yield self.send_data(datax, epnum, data)
-            yield recv.join()
+            await self.send_data(datax, epnum, data)
+            await recv.join()
 
-    @cocotb.coroutine
-    def set_data(self, ep, data):
-        for b in data:
-            yield self.write(self.csrs['usb_in_data'], b)
+    async def set_data(self, ep, data):
+        await self.burst_write(self._usb_in_data, data)
 
-    @cocotb.coroutine
-    def control_transfer_out(self, addr, setup_data, descriptor_data=None):
+    async def control_transfer_out(self, addr, setup_data,
+                                   descriptor_data=None):
         epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
         epaddr_in = EndpointType.epaddr(0, EndpointType.IN)
 
@@ -302,15 +417,15 @@ class UsbTestValenty(UsbTest):
                 "an OUT transfer"
             )
 
-        setup_ev = yield self.read(self.csrs['usb_setup_ev_pending'])
+        setup_ev = await self.read(self._usb_setup_ev_pending)
 
         # Setup stage
         self.dut._log.info("setup stage")
-        yield self.transaction_setup(addr, setup_data)
-        self.request_deadline = get_sim_time("us") + super().MAX_REQUEST_TIME
+        await self.transaction_setup(addr, setup_data)
+        self.request_deadline = get_sim_time("us") + self.MAX_REQUEST_TIME
 
-        setup_ev = yield self.read(self.csrs['usb_setup_ev_pending'])
-        yield self.write(self.csrs['usb_setup_ev_pending'], setup_ev)
+        setup_ev = await self.read(self._usb_setup_ev_pending)
+        await self.write(self._usb_setup_ev_pending, setup_ev)
 
         # Data stage
         if (setup_data[7] != 0
@@ -327,25 +442,27 @@ class UsbTestValenty(UsbTest):
             )
         if descriptor_data is not None:
             self.dut._log.info("data stage")
-            yield self.transaction_data_out(addr, epaddr_out, descriptor_data)
+            await self.transaction_data_out(addr, epaddr_out, descriptor_data)
 
         # Status stage
         self.dut._log.info("status stage")
-        self.packet_deadline = get_sim_time("us") + super().MAX_PACKET_TIME
-        yield self.write(self.csrs['usb_in_ctrl'], 0)  # Send empty IN packet
-        yield self.transaction_status_in(addr, epaddr_in)
-        yield RisingEdge(self.dut.clk12)
-        yield RisingEdge(self.dut.clk12)
-        in_ev = yield self.read(self.csrs['usb_in_ev_pending'])
-        yield self.write(self.csrs['usb_in_ev_pending'], in_ev)
-        yield self.write(self.csrs['usb_in_ctrl'], 1 << 5)  # Reset IN buffer
+        self.packet_deadline = get_sim_time("us") + self.MAX_PACKET_TIME
+        await self.write(self._usb_in_ctrl, 0)  # Send empty IN packet
+        await self.transaction_status_in(addr, epaddr_in)
+        await RisingEdge(self.dut.clk12)
+        await RisingEdge(self.dut.clk12)
+        in_ev = await self.read(self._usb_in_ev_pending)
+        await self.write_many([
+            (self._usb_in_ev_pending, in_ev),
+            (self._usb_in_ctrl, 1 << 5),  # Reset IN buffer
+        ])
 
         # Was the time limit honored?
         if get_sim_time("us") > self.request_deadline:
             raise TestFailure("Failed to process the OUT request in time")
 
-    @cocotb.coroutine
-    def control_transfer_in(self, addr, setup_data, descriptor_data=None):
+    async def control_transfer_in(self, addr, setup_data,
+                                  descriptor_data=None):
         epaddr_out = EndpointType.epaddr(0, EndpointType.OUT)
         epaddr_in = EndpointType.epaddr(0, EndpointType.IN)
 
@@ -355,18 +472,18 @@ class UsbTestValenty(UsbTest):
                 "an IN transfer"
             )
 
-        setup_ev = yield self.read(self.csrs['usb_setup_ev_pending'])
+        setup_ev = await self.read(self._usb_setup_ev_pending)
 
         # Setup stage
         self.dut._log.info("setup stage")
-        yield self.transaction_setup(addr, setup_data)
-        self.request_deadline = get_sim_time("us") + super().MAX_REQUEST_TIME
+        await self.transaction_setup(addr, setup_data)
+        self.request_deadline = get_sim_time("us") + self.MAX_REQUEST_TIME
 
-        setup_ev = yield self.read(self.csrs['usb_setup_ev_pending'])
-        yield self.write(self.csrs['usb_setup_ev_pending'], setup_ev)
+        setup_ev = await self.read(self._usb_setup_ev_pending)
+        await self.write(self._usb_setup_ev_pending, setup_ev)
 
         # Data stage
-        in_ev = yield self.read(self.csrs['usb_in_ev_pending'])
+        in_ev = await self.read(self._usb_in_ev_pending)
         if (setup_data[7] != 0
                 or setup_data[6] != 0) and descriptor_data is None:
             raise Exception(
@@ -381,31 +498,32 @@ class UsbTestValenty(UsbTest):
             )
         if descriptor_data is not None:
             self.dut._log.info("data stage")
-            yield self.transaction_data_in(addr, epaddr_in, descriptor_data)
+            await self.transaction_data_in(addr, epaddr_in, descriptor_data)
 
             # Give the signal two clock cycles
             # to percolate through the event manager
-            yield RisingEdge(self.dut.clk12)
-            yield RisingEdge(self.dut.clk12)
-            in_ev = yield self.read(self.csrs['usb_in_ev_pending'])
-            yield self.write(self.csrs['usb_in_ev_pending'], in_ev)
+            await RisingEdge(self.dut.clk12)
+            await RisingEdge(self.dut.clk12)
+            in_ev = await self.read(self._usb_in_ev_pending)
+            await self.write(self._usb_in_ev_pending, in_ev)
 
         # Status stage
-        self.packet_deadline = get_sim_time("us") + super().MAX_PACKET_TIME
-        yield self.write(self.csrs['usb_out_ctrl'], 0x10)  # Send empty packet
+        self.packet_deadline = get_sim_time("us") + self.MAX_PACKET_TIME
+        await self.write(self._usb_out_ctrl, 0x10)  # Send empty packet
         self.dut._log.info("status stage")
-        out_ev = yield self.read(self.csrs['usb_out_ev_pending'])
-        yield self.transaction_status_out(addr, epaddr_out)
-        yield RisingEdge(self.dut.clk12)
-        out_ev = yield self.read(self.csrs['usb_out_ev_pending'])
-        yield self.write(self.csrs['usb_out_ctrl'], 0x20)  # Reset FIFO
-        yield self.write(self.csrs['usb_out_ev_pending'], out_ev)
+        out_ev = await self.read(self._usb_out_ev_pending)
+        await self.transaction_status_out(addr, epaddr_out)
+        await RisingEdge(self.dut.clk12)
+        out_ev = await self.read(self._usb_out_ev_pending)
+        await self.write_many([
+            (self._usb_out_ctrl, 0x20),  # Reset FIFO
+            (self._usb_out_ev_pending, out_ev),
+        ])
 
         # Was the time limit honored?
         if get_sim_time("us") > self.request_deadline:
             raise TestFailure("Failed to process the IN request in time")
 
-    @cocotb.coroutine
-    def set_device_address(self, address):
-        yield super().set_device_address(address)
-        yield self.write(self.csrs['usb_address'], address)
+    async def set_device_address(self, address):
+        await super().set_device_address(address)
+        await self.write(self._usb_address, address)
@@ -80,16 +80,51 @@ def crc5_sof(v):
     return eval('0b' + bin(reg.getFinalValue() | 0x10000000)[::-1][:5])
 
 
+def _crc16_table():
+    # Reflected form of the CRC-16/USB polynomial 0x8005
+    table = []
+    for i in range(256):
+        reg = i
+        for _ in range(8):
+            if reg & 1:
+                reg = (reg >> 1) ^ 0xa001
+            else:
+                reg >>= 1
+        table.append(reg)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+# Register value left after running the data and its CRC16 through
+# CRC16_TABLE, starting from 0xffff (no final xor).
+CRC16_RESIDUE = 0xb001
+
+
 def crc16(input_data):
+    """
+    >>> crc16([0x80, 0x06, 0x00, 0x01, 0x00, 0x00, 0x40, 0x00])
+    [221, 148]
+    >>> crc16([])
+    [0, 0]
+
+    Checking a received packet with the residue:
+
+    >>> reg = 0xffff
+    >>> for d in [1, 2, 3] + crc16([1, 2, 3]):
+    ...     reg = CRC16_TABLE[(reg ^ d) & 0xff] ^ (reg >> 8)
+    >>> reg == CRC16_RESIDUE
+    True
+    """
     # width=16 poly=0x8005 init=0xffff refin=true refout=true xorout=0xffff
     # check=0xb4c8 residue=0xb001 name="CRC-16/USB"
     # CRC appended low byte first.
-    reg = crc.CrcRegister(crc.CRC16_USB)
+    table = CRC16_TABLE
+    reg = 0xffff
     for d in input_data:
         assert d <= 0xff, input_data
-        reg.takeWord(d, 8)
-    crc16 = reg.getFinalValue()
-    return [crc16 & 0xff, (crc16 >> 8) & 0xff]
+        reg = table[(reg ^ d) & 0xff] ^ (reg >> 8)
+    reg ^= 0xffff
+    return [reg & 0xff, reg >> 8]
 
 
 def nrzi(data, cycles=4, init="J"):
@@ -365,3 +365,20 @@ class WishboneMaster(Wishbone):
         for rec in result:
             self.log.debug("Result: {}".format(rec))
         raise ReturnValue(0)
+
+    @coroutine
+    def write_many(self, ops, idle=1):
+        """Perform several writes within a single bus cycle.
+
+        Args:
+            ops: Sequence of ``(adr, data)`` pairs, written in order.
+            idle (int, optional): Clock cycles with strobe low between
+                consecutive writes.
+        """
+        ops = [WBOp(adr >> 2, data, idle=idle if i else 0)
+               for i, (adr, data) in enumerate(ops)]
+        if ops:
+            result = yield self.send_cycle(ops)
+            for rec in result:
+                self.log.debug("Result: {}".format(rec))
+        raise ReturnValue(0)